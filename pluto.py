@@ -1,7 +1,14 @@
-import os, uuid, requests, json, pytz, gzip, re
-from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
+import os, uuid, requests, gzip
+import cachetools
+import orjson
+from datetime import datetime, timezone
+from lxml import etree as ET
 import threading
+import itertools
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ---------------------------------------------------------------------------
 # Multi-stream workaround
@@ -24,6 +31,111 @@ try:
 except (ValueError, TypeError):
     STREAM_POOL_SIZE = DEFAULT_STREAM_POOL_SIZE
 
+UTC = timezone.utc
+
+# Timeline batches are fetched concurrently; keep this modest so Pluto does
+# not start rate-limiting the guide endpoint.  Countries are also refreshed
+# in parallel, so peak concurrency is EPG_COUNTRY_WORKERS * EPG_FETCH_WORKERS.
+EPG_FETCH_WORKERS = 8
+EPG_COUNTRY_WORKERS = 2
+
+# Boot responses (session tokens) are reused for 4 hours per country
+BOOT_CACHE_TTL = 4 * 60 * 60
+BOOT_CACHE_SIZE = 16
+
+# Code points that are not allowed in XML 1.0 (tab, LF and CR are kept).
+# lxml refuses to build elements containing any of these.
+_ILLEGAL_TRANSLATE = dict.fromkeys(
+    list(range(0x00, 0x09)) + [0x0b, 0x0c] + list(range(0x0e, 0x20))
+    + list(range(0xd800, 0xe000)) + [0xfffe, 0xffff],
+    None,
+)
+
+XMLTV_DOCTYPE = '<!DOCTYPE tv SYSTEM "xmltv.dtd">'
+
+BOOT_HEADERS = {
+    'authority': 'boot.pluto.tv',
+    'accept': '*/*',
+    'accept-language': 'en-US,en;q=0.9',
+    'origin': 'https://pluto.tv',
+    'referer': 'https://pluto.tv/',
+    'sec-ch-ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Linux"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-site',
+    'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+}
+
+CHANNEL_SERVICE_HEADERS = {
+    'authority': 'service-channels.clusters.pluto.tv',
+    'accept': '*/*',
+    'accept-language': 'en-US,en;q=0.9',
+    'origin': 'https://pluto.tv',
+    'referer': 'https://pluto.tv/',
+}
+
+
+def create_session(headers=None):
+    """requests.Session with a shared keep-alive pool and GET retries."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,      # surface the final response as before
+        ),
+    )
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def parse_pluto_datetime(value):
+    """Parse a Pluto UTC timestamp such as '2024-01-01T10:00:00.000Z'."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def load_json(response):
+    """Decode a JSON response body with orjson (skips the .text decode)."""
+    return orjson.loads(response.content)
+
+
+def claim_channel_number(number, next_free):
+    """
+    Claim the lowest free channel number >= number.
+
+    next_free maps every claimed number to a candidate at or above the next
+    free slot; chains are compressed as they are walked, so a dense block of
+    collisions is skipped in amortised O(1) instead of probed one by one.
+    """
+    path = []
+    while number in next_free:
+        path.append(number)
+        number = next_free[number]
+    next_free[number] = number + 1
+    for claimed in path:
+        next_free[claimed] = number + 1
+    return number
+
+
+class TeeWriter:
+    """Minimal file-like object that copies every write to several files."""
+
+    def __init__(self, *files):
+        self.files = files
+
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+        return len(data)
+
 
 def format_request_error(exc):
     message = str(exc).strip()
@@ -32,41 +144,86 @@ def format_request_error(exc):
     return f"Error Exception type: {type(exc).__name__}"
 
 
+# Pluto genre / sub-genre names mapped onto XMLTV categories
+_SERIES_GENRES = MappingProxyType({
+    ("Animated",): ("Family Animation", "Cartoons"),
+    ("Educational",): ("Education & Guidance", "Instructional & Educational"),
+    ("News",): ("News and Information", "General News", "News + Opinion", "General News"),
+    ("History",): ("History & Social Studies",),
+    ("Politics",): ("Politics",),
+    ("Action",): (
+        "Action & Adventure", "Action Classics", "Martial Arts", "Crime Action",
+        "Family Adventures", "Action Sci-Fi & Fantasy", "Action Thrillers", "African-American Action",
+    ),
+    ("Adventure",): ("Action & Adventure", "Adventures", "Sci-Fi Adventure"),
+    ("Reality",): ("Reality", "Reality Drama", "Courtroom Reality", "Occupational Reality", "Celebrity Reality"),
+    ("Documentary",): (
+        "Documentaries", "Social & Cultural Documentaries", "Science and Nature Documentaries",
+        "Miscellaneous Documentaries", "Crime Documentaries", "Travel & Adventure Documentaries",
+        "Sports Documentaries", "Military Documentaries", "Political Documentaries", "Foreign Documentaries",
+        "Religion & Mythology Documentaries", "Historical Documentaries", "Biographical Documentaries",
+        "Faith & Spirituality Documentaries",
+    ),
+    ("Biography",): ("Biographical Documentaries", "Inspirational Biographies"),
+    ("Science Fiction",): ("Sci-Fi Thrillers", "Sci-Fi Adventure", "Action Sci-Fi & Fantasy"),
+    ("Thriller",): ("Sci-Fi Thrillers", "Thrillers", "Crime Thrillers"),
+    ("Talk",): ("Talk & Variety", "Talk Show"),
+    ("Variety",): ("Sketch Comedies",),
+    ("Home Improvement",): ("Art & Design", "DIY & How To", "Home Improvement"),
+    ("House/garden",): ("Home & Garden",),
+    ("Cooking",): ("Cooking Instruction", "Food & Wine", "Food Stories"),
+    ("Travel",): ("Travel & Adventure Documentaries", "Travel"),
+    ("Western",): ("Westerns", "Classic Westerns"),
+    ("LGBTQ",): ("Gay & Lesbian", "Gay & Lesbian Dramas", "Gay"),
+    ("Game show",): ("Game Show",),
+    ("Military",): ("Classic War Stories",),
+    ("Comedy",): (
+        "Cult Comedies", "Spoofs and Satire", "Slapstick", "Classic Comedies", "Stand-Up",
+        "Sports Comedies", "African-American Comedies", "Showbiz Comedies", "Sketch Comedies",
+        "Teen Comedies", "Latino Comedies", "Family Comedies",
+    ),
+    ("Crime",): ("Crime Action", "Crime Drama", "Crime Documentaries"),
+    ("Sports",): ("Sports", "Sports & Sports Highlights", "Sports Documentaries", "Poker & Gambling"),
+    ("Poker & Gambling",): ("Poker & Gambling",),
+    ("Crime drama",): ("Crime Drama",),
+    ("Drama",): ("Classic Dramas", "Family Drama", "Indie Drama", "Romantic Drama", "Crime Drama"),
+    ("Children",): ("Kids", "Children & Family", "Kids' TV", "Cartoons", "Animals", "Family Animation", "Ages 2-4", "Ages 11-12"),
+})
+
+
+def _build_genre_index(genre_map):
+    """Invert genre_map: Pluto genre -> every category whose list contains it."""
+    index = {}
+    for categories, genres in genre_map.items():
+        for genre in genres:
+            index.setdefault(genre, {}).update(dict.fromkeys(categories))
+    return {genre: tuple(categories) for genre, categories in index.items()}
+
+
+_GENRE_INDEX = _build_genre_index(_SERIES_GENRES)
+
+
 class StreamSession:
     """One 'virtual device' – its own clientID, requests.Session and token cache."""
 
     def __init__(self, username=None, password=None):
-        self.session = requests.Session()
+        self.session = create_session(BOOT_HEADERS)
         self.client_id = str(uuid.uuid4())          # unique per virtual device
-        self.response_list = {}
-        self.sessionAt = {}
+        self._boot_cache = cachetools.TTLCache(maxsize=BOOT_CACHE_SIZE, ttl=BOOT_CACHE_TTL)
+        self._boot_cache_lock = threading.Lock()
         self.username = username
         self.password = password
 
+    def cached_response(self, country_code):
+        """Boot response for country_code if it has not expired, else None."""
+        with self._boot_cache_lock:
+            return self._boot_cache.get(country_code)
+
     def boot(self, country_code, x_forward):
         """Authenticate / refresh token for this virtual device."""
-        desired_timezone = pytz.timezone('UTC')
-        current_date = datetime.now(desired_timezone)
-
         # Return cached token if still fresh (< 4 h old)
-        if (self.response_list.get(country_code) is not None and
-                (current_date - self.sessionAt.get(country_code, datetime.min.replace(tzinfo=pytz.utc))) < timedelta(hours=4)):
-            return self.response_list[country_code], None
-
-        boot_headers = {
-            'authority': 'boot.pluto.tv',
-            'accept': '*/*',
-            'accept-language': 'en-US,en;q=0.9',
-            'origin': 'https://pluto.tv',
-            'referer': 'https://pluto.tv/',
-            'sec-ch-ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Linux"',
-            'sec-fetch-dest': 'empty',
-            'sec-fetch-mode': 'cors',
-            'sec-fetch-site': 'same-site',
-            'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-        }
+        if (cached := self.cached_response(country_code)) is not None:
+            return cached, None
 
         boot_params = {
             'appName': 'web',
@@ -89,8 +246,8 @@ class StreamSession:
             boot_params['username'] = self.username
             boot_params['password'] = self.password
 
-        if country_code in x_forward:
-            boot_headers.update(x_forward[country_code])
+        # Static boot headers live on the session; only the geo override varies
+        boot_headers = x_forward.get(country_code, {})
 
         try:
             response = self.session.get(
@@ -102,12 +259,13 @@ class StreamSession:
             return None, format_request_error(e)
 
         if 200 <= response.status_code <= 201:
-            resp = response.json()
+            resp = load_json(response)
         else:
             return None, f"HTTP failure {response.status_code}: {response.text}"
 
-        self.response_list[country_code] = resp
-        self.sessionAt[country_code] = current_date
+        with self._boot_cache_lock:
+            self._boot_cache[country_code] = resp
+        current_date = datetime.now(UTC)
         print(f"[slot {self.client_id[:8]}] New token for {country_code} at "
               f"{current_date.strftime('%Y-%m-%d %H:%M.%S %z')}")
         return resp, None
@@ -123,13 +281,12 @@ class Client:
             StreamSession(username=username, password=password)
             for _ in range(STREAM_POOL_SIZE)
         ]
-        self._pool_index = 0
-        self._pool_lock = threading.Lock()
+        self._pool_cycle = itertools.cycle(self._pool)
 
         # ---- legacy single session (used for EPG / channel metadata only) ----
-        self.session = requests.Session()
-        self.sessionAt = {}
-        self.response_list = {}
+        self.session = create_session(CHANNEL_SERVICE_HEADERS)
+        self._boot_cache = cachetools.TTLCache(maxsize=BOOT_CACHE_SIZE, ttl=BOOT_CACHE_TTL)
+        self._boot_cache_lock = threading.Lock()
         self.epg_data = {}
         self.device = None
         self.all_channels = {}
@@ -150,11 +307,8 @@ class Client:
     # ------------------------------------------------------------------
 
     def _next_slot(self) -> StreamSession:
-        """Round-robin through the session pool (thread-safe)."""
-        with self._pool_lock:
-            slot = self._pool[self._pool_index % STREAM_POOL_SIZE]
-            self._pool_index += 1
-        return slot
+        """Round-robin through the session pool (next() on a cycle is atomic under the GIL)."""
+        return next(self._pool_cycle)
 
     def get_stream_token(self, country_code) -> tuple:
         """
@@ -180,18 +334,17 @@ class Client:
 
     def resp_data(self, country_code):
         """Primary boot session used for channel/EPG metadata (not streams)."""
-        desired_timezone = pytz.timezone('UTC')
-        current_date = datetime.now(desired_timezone)
-        if (self.response_list.get(country_code) is not None and
-                (current_date - self.sessionAt.get(country_code, datetime.now())) < timedelta(hours=4)):
-            return self.response_list[country_code], None
+        with self._boot_cache_lock:
+            cached = self._boot_cache.get(country_code)
+        if cached is not None:
+            return cached, None
 
         # Delegate to pool slot 0 for metadata (keeps original behaviour)
         resp, error = self._pool[0].boot(country_code, self.x_forward)
         if error:
             return None, error
-        self.response_list[country_code] = resp
-        self.sessionAt[country_code] = current_date
+        with self._boot_cache_lock:
+            self._boot_cache[country_code] = resp
         return resp, None
 
     def channels(self, country_code):
@@ -207,14 +360,10 @@ class Client:
             return None, error
 
         url = "https://service-channels.clusters.pluto.tv/v2/guide/channels"
+        category_url = "https://service-channels.clusters.pluto.tv/v2/guide/categories"
 
         headers = {
-            'authority': 'service-channels.clusters.pluto.tv',
-            'accept': '*/*',
-            'accept-language': 'en-US,en;q=0.9',
             'authorization': f'Bearer {token}',
-            'origin': 'https://pluto.tv',
-            'referer': 'https://pluto.tv/',
         }
 
         params = {
@@ -227,27 +376,24 @@ class Client:
         if country_code in self.x_forward:
             headers.update(self.x_forward[country_code])
 
-        try:
-            response = self.session.get(url, params=params, headers=headers)
-        except Exception as e:
-            return None, format_request_error(e)
+        # Both lookups share host, headers and params, so issue them together
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            channel_future = executor.submit(self.session.get, url, params=params, headers=headers)
+            category_future = executor.submit(self.session.get, category_url, params=params, headers=headers)
 
-        if response.status_code != 200:
-            return None, f"HTTP failure {response.status_code}: {response.text}"
-
-        channel_list = response.json().get("data")
-
-        category_url = "https://service-channels.clusters.pluto.tv/v2/guide/categories"
-
-        try:
-            response = self.session.get(category_url, params=params, headers=headers)
-        except Exception as e:
-            return None, format_request_error(e)
+        responses = []
+        for future in (channel_future, category_future):
+            try:
+                response = future.result()
+            except Exception as e:
+                return None, format_request_error(e)
 
-        if response.status_code != 200:
-            return None, f"HTTP failure {response.status_code}: {response.text}"
+            if response.status_code != 200:
+                return None, f"HTTP failure {response.status_code}: {response.text}"
+            responses.append(response)
 
-        categories_data = response.json().get("data")
+        channel_list = load_json(responses[0]).get("data")
+        categories_data = load_json(responses[1]).get("data")
 
         categories_list = {}
         for elem in categories_data:
@@ -257,6 +403,7 @@ class Client:
                 categories_list[channel] = category
 
         stations = []
+        next_free = {}
         for elem in channel_list:
             entry = {
                 'id':           elem.get('id'),
@@ -268,10 +415,7 @@ class Client:
                 'country_code': country_code,
             }
 
-            number = elem.get('number')
-            existing_numbers = {ch["number"] for ch in stations}
-            while number in existing_numbers:
-                number += 1
+            number = claim_channel_number(elem.get('number'), next_free)
 
             color_logo_png = next(
                 (image["url"] for image in elem["images"] if image["type"] == "colorLogoPNG"),
@@ -289,14 +433,13 @@ class Client:
         for key, val in self.all_channels.items():
             all_channel_list.extend(val)
 
-        seen = set()
-        filter_key = 'id'
-        filtered_list = [
-            d for d in all_channel_list
-            if d[filter_key] not in seen and not seen.add(d[filter_key])
-        ]
+        # First occurrence of each channel id wins, in original order
+        unique_channels = {}
+        for d in all_channel_list:
+            unique_channels.setdefault(d['id'], d)
+        filtered_list = list(unique_channels.values())
 
-        seen = set()
+        next_free = {}
         for elem in filtered_list:
             number = elem.get('number')
             match elem.get('country_code', '').lower():
@@ -317,9 +460,7 @@ class Client:
                     if number < offset:
                         number += offset
 
-            while number in seen:
-                number += 1
-            seen.add(number)
+            number = claim_channel_number(number, next_free)
             if number != elem.get('number'):
                 elem['number'] = number
 
@@ -330,8 +471,22 @@ class Client:
     # ------------------------------------------------------------------
 
     def strip_illegal_characters(self, xml_string):
-        illegal_char_pattern = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
-        return illegal_char_pattern.sub('', xml_string)
+        """Make a text or attribute value safe for XML (None becomes '')."""
+        if xml_string is None:
+            return ''
+        return str(xml_string).translate(_ILLEGAL_TRANSLATE)
+
+    def _fetch_epg_group(self, url, epg_params, epg_headers, group):
+        """Fetch one batch of channel timelines; returns (data, error)."""
+        epg_params['channelIds'] = ','.join(map(str, group))
+        try:
+            response = self.session.get(url, params=epg_params, headers=epg_headers)
+        except Exception as e:
+            return None, format_request_error(e)
+
+        if response.status_code != 200:
+            return None, f"HTTP failure {response.status_code}: {response.text}"
+        return load_json(response), None
 
     def update_epg(self, country_code, range_count=3):
         resp, error = self.resp_data(country_code)
@@ -342,20 +497,14 @@ class Client:
         if token is None:
             return "Missing sessionToken in boot response"
 
-        desired_timezone = pytz.timezone('UTC')
-        start_datetime = datetime.now(desired_timezone)
+        start_datetime = datetime.now(UTC)
         start_time = start_datetime.strftime("%Y-%m-%dT%H:00:00.000Z")
         end_time = start_time
 
         url = "https://service-channels.clusters.pluto.tv/v2/guide/timelines"
 
         epg_headers = {
-            'authority': 'service-channels.clusters.pluto.tv',
-            'accept': '*/*',
-            'accept-language': 'en-US,en;q=0.9',
             'authorization': f'Bearer {token}',
-            'origin': 'https://pluto.tv',
-            'referer': 'https://pluto.tv/',
         }
 
         epg_params = {
@@ -377,25 +526,38 @@ class Client:
         country_data = []
 
         for i in range(range_count):
+            if not grouped_id_values:
+                break   # no channels, so no timelines to fetch
+
             if end_time != start_time:
                 start_time = end_time
                 epg_params['start'] = start_time
             print(f'Retrieving {country_code} EPG data for {start_time}')
 
-            for group in grouped_id_values:
-                epg_params['channelIds'] = ','.join(map(str, group))
-                try:
-                    response = self.session.get(url, params=epg_params, headers=epg_headers)
-                except Exception as e:
-                    return format_request_error(e)
+            results = {}
+            errors = []
+            with ThreadPoolExecutor(max_workers=min(EPG_FETCH_WORKERS, len(grouped_id_values))) as executor:
+                futures = {
+                    executor.submit(self._fetch_epg_group, url, dict(epg_params), epg_headers, group): index
+                    for index, group in enumerate(grouped_id_values)
+                }
+                for future in as_completed(futures):
+                    data, error = future.result()
+                    if error:
+                        print(f'[epg] {country_code} batch {futures[future]} failed: {error}')
+                        errors.append(error)
+                    else:
+                        results[futures[future]] = data
 
-                if response.status_code != 200:
-                    return f"HTTP failure {response.status_code}: {response.text}"
-                country_data.append(response.json())
+            if not results:
+                return errors[0]
+
+            # Keep batches in channel order so the guide output is stable
+            batch_data = [results[index] for index in sorted(results)]
+            country_data.extend(batch_data)
 
             end_time = (
-                datetime.strptime(response.json()["meta"]["endDateTime"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                .replace(tzinfo=pytz.utc)
+                max(parse_pluto_datetime(data["meta"]["endDateTime"]) for data in batch_data)
                 .strftime("%Y-%m-%dT%H:00:00.000Z")
             )
 
@@ -409,97 +571,53 @@ class Client:
             return None, error_code
         return self.epg_data, None
 
-    def find_tuples_by_value(self, dictionary, target_value):
-        result_list = []
-        for key, values in dictionary.items():
-            if target_value in values:
-                result_list.extend(key)
-        return result_list if result_list else [target_value]
-
-    def read_epg_data(self, resp, root):
-        seriesGenres = {
-            ("Animated",): ["Family Animation", "Cartoons"],
-            ("Educational",): ["Education & Guidance", "Instructional & Educational"],
-            ("News",): ["News and Information", "General News", "News + Opinion", "General News"],
-            ("History",): ["History & Social Studies"],
-            ("Politics",): ["Politics"],
-            ("Action",): [
-                "Action & Adventure", "Action Classics", "Martial Arts", "Crime Action",
-                "Family Adventures", "Action Sci-Fi & Fantasy", "Action Thrillers", "African-American Action",
-            ],
-            ("Adventure",): ["Action & Adventure", "Adventures", "Sci-Fi Adventure"],
-            ("Reality",): ["Reality", "Reality Drama", "Courtroom Reality", "Occupational Reality", "Celebrity Reality"],
-            ("Documentary",): [
-                "Documentaries", "Social & Cultural Documentaries", "Science and Nature Documentaries",
-                "Miscellaneous Documentaries", "Crime Documentaries", "Travel & Adventure Documentaries",
-                "Sports Documentaries", "Military Documentaries", "Political Documentaries", "Foreign Documentaries",
-                "Religion & Mythology Documentaries", "Historical Documentaries", "Biographical Documentaries",
-                "Faith & Spirituality Documentaries",
-            ],
-            ("Biography",): ["Biographical Documentaries", "Inspirational Biographies"],
-            ("Science Fiction",): ["Sci-Fi Thrillers", "Sci-Fi Adventure", "Action Sci-Fi & Fantasy"],
-            ("Thriller",): ["Sci-Fi Thrillers", "Thrillers", "Crime Thrillers"],
-            ("Talk",): ["Talk & Variety", "Talk Show"],
-            ("Variety",): ["Sketch Comedies"],
-            ("Home Improvement",): ["Art & Design", "DIY & How To", "Home Improvement"],
-            ("House/garden",): ["Home & Garden"],
-            ("Cooking",): ["Cooking Instruction", "Food & Wine", "Food Stories"],
-            ("Travel",): ["Travel & Adventure Documentaries", "Travel"],
-            ("Western",): ["Westerns", "Classic Westerns"],
-            ("LGBTQ",): ["Gay & Lesbian", "Gay & Lesbian Dramas", "Gay"],
-            ("Game show",): ["Game Show"],
-            ("Military",): ["Classic War Stories"],
-            ("Comedy",): [
-                "Cult Comedies", "Spoofs and Satire", "Slapstick", "Classic Comedies", "Stand-Up",
-                "Sports Comedies", "African-American Comedies", "Showbiz Comedies", "Sketch Comedies",
-                "Teen Comedies", "Latino Comedies", "Family Comedies",
-            ],
-            ("Crime",): ["Crime Action", "Crime Drama", "Crime Documentaries"],
-            ("Sports",): ["Sports", "Sports & Sports Highlights", "Sports Documentaries", "Poker & Gambling"],
-            ("Poker & Gambling",): ["Poker & Gambling"],
-            ("Crime drama",): ["Crime Drama"],
-            ("Drama",): ["Classic Dramas", "Family Drama", "Indie Drama", "Romantic Drama", "Crime Drama"],
-            ("Children",): ["Kids", "Children & Family", "Kids' TV", "Cartoons", "Animals", "Family Animation", "Ages 2-4", "Ages 11-12"],
-        }
+    def find_tuples_by_value(self, target_value):
+        return list(_GENRE_INDEX.get(target_value, (target_value,)))
 
+    def read_epg_data(self, resp):
+        """Yield one <programme> element per timeline in a guide response."""
         for entry in resp["data"]:
             for timeline in entry["timelines"]:
-                programme = ET.SubElement(root, "programme", attrib={
-                    "channel": entry["channelId"],
-                    "start": datetime.strptime(timeline["start"], "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=pytz.utc).strftime("%Y%m%d%H%M%S %z"),
-                    "stop":  datetime.strptime(timeline["stop"],  "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=pytz.utc).strftime("%Y%m%d%H%M%S %z"),
+                start_dt = parse_pluto_datetime(timeline["start"])
+                stop_dt = parse_pluto_datetime(timeline["stop"])
+                orig_dt = parse_pluto_datetime(timeline["episode"]["clip"]["originalReleaseDate"])
+
+                programme = ET.Element("programme", attrib={
+                    "channel": self.strip_illegal_characters(entry["channelId"]),
+                    # Pluto timestamps are always UTC, so the offset is fixed
+                    "start": start_dt.strftime("%Y%m%d%H%M%S") + " +0000",
+                    "stop":  stop_dt.strftime("%Y%m%d%H%M%S") + " +0000",
                 })
                 title = ET.SubElement(programme, "title")
                 title.text = self.strip_illegal_characters(timeline["title"])
 
                 if timeline["episode"].get("series", {}).get("type", "") == "live":
-                    if timeline["episode"]["clip"]["originalReleaseDate"] == timeline["start"]:
+                    if orig_dt == start_dt:
                         ET.SubElement(programme, "live")
                     if timeline["episode"].get("season", None):
                         ep = ET.SubElement(programme, "episode-num", attrib={"system": "onscreen"})
                         ep.text = f'S{timeline["episode"]["season"]:02d}E{timeline["episode"]["number"]:02d}'
                         ep2 = ET.SubElement(programme, "episode-num", attrib={"system": "pluto"})
-                        ep2.text = timeline["episode"]["_id"]
+                        ep2.text = self.strip_illegal_characters(timeline["episode"]["_id"])
                 elif timeline["episode"].get("series", {}).get("type", "") == "tv":
                     ep = ET.SubElement(programme, "episode-num", attrib={"system": "onscreen"})
                     ep.text = f'S{timeline["episode"]["season"]:02d}E{timeline["episode"]["number"]:02d}'
                     ep2 = ET.SubElement(programme, "episode-num", attrib={"system": "pluto"})
-                    ep2.text = timeline["episode"]["_id"]
+                    ep2.text = self.strip_illegal_characters(timeline["episode"]["_id"])
 
                 air = ET.SubElement(programme, "episode-num", attrib={"system": "original-air-date"})
-                air.text = (datetime.strptime(timeline["episode"]["clip"]["originalReleaseDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                            .replace(tzinfo=pytz.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + 'Z')
+                air.text = orig_dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + 'Z'
 
                 desc = ET.SubElement(programme, "desc")
                 desc.text = self.strip_illegal_characters(timeline["episode"]["description"]).replace('&quot;', '"')
 
-                ET.SubElement(programme, "icon", attrib={"src": timeline["episode"]["series"]["tile"]["path"]})
+                ET.SubElement(programme, "icon", attrib={"src": self.strip_illegal_characters(timeline["episode"]["series"]["tile"]["path"])})
 
                 date = ET.SubElement(programme, "date")
-                date.text = datetime.strptime(timeline["episode"]["clip"]["originalReleaseDate"], "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y%m%d")
+                date.text = orig_dt.strftime("%Y%m%d")
 
                 sid = ET.SubElement(programme, "series-id", attrib={"system": "pluto"})
-                sid.text = timeline["episode"]["series"]["_id"]
+                sid.text = self.strip_illegal_characters(timeline["episode"]["series"]["_id"])
 
                 if timeline["title"].lower() != timeline["episode"]["name"].lower():
                     sub = ET.SubElement(programme, "sub-title")
@@ -507,47 +625,44 @@ class Client:
 
                 categories = []
                 if timeline["episode"].get("genre"):
-                    categories.extend(self.find_tuples_by_value(seriesGenres, timeline["episode"]["genre"]))
+                    categories.extend(self.find_tuples_by_value(timeline["episode"]["genre"]))
                 stype = timeline["episode"].get("series", {}).get("type", "")
                 if stype == "tv":
                     categories.append("Series")
                 if stype == "film":
                     categories.append("Movie")
                 if timeline["episode"].get("subGenre"):
-                    categories.extend(self.find_tuples_by_value(seriesGenres, timeline["episode"]["subGenre"]))
+                    categories.extend(self.find_tuples_by_value(timeline["episode"]["subGenre"]))
 
-                unique_list = []
-                for item in categories:
-                    if item not in unique_list:
-                        unique_list.append(item)
-                for category in unique_list:
+                for category in dict.fromkeys(categories):
                     cat_elem = ET.SubElement(programme, "category")
-                    cat_elem.text = category
+                    cat_elem.text = self.strip_illegal_characters(category)
 
-        return root
+                yield programme
 
     def get_all_epg_data(self, country_code):
         all_epg_data = []
         channelIds_seen = {}
         range_count = 3
 
-        for country in country_code:
-            error_code = self.update_epg(country, range_count)
+        # Countries are independent; each update_epg writes only its own epg_data key
+        with ThreadPoolExecutor(max_workers=min(EPG_COUNTRY_WORKERS, len(country_code) or 1)) as executor:
+            errors = list(executor.map(lambda country: self.update_epg(country, range_count), country_code))
+
+        for country, error_code in zip(country_code, errors):
             if error_code:
                 return error_code
 
             for epg_list in self.epg_data.get(country):
-                data_list = epg_list.get('data')
-                for entry in data_list[:]:
+                # Keep at most range_count timeline blocks per channel across countries
+                filtered = []
+                for entry in epg_list.get('data'):
                     channelId = entry.get('channelId')
-                    if channelId in channelIds_seen:
-                        if channelIds_seen[channelId] < range_count:
-                            channelIds_seen[channelId] += 1
-                        else:
-                            data_list.remove(entry)
-                    else:
-                        channelIds_seen[channelId] = 1
-                all_epg_data.append({'data': data_list})
+                    count = channelIds_seen.get(channelId, 0)
+                    if count < range_count:
+                        filtered.append(entry)
+                        channelIds_seen[channelId] = count + 1
+                all_epg_data.append({'data': filtered})
 
         return all_epg_data
 
@@ -570,13 +685,6 @@ class Client:
             return "The variable is neither a string nor a list."
 
         compressed_file_path = f"{xml_file_path}.gz"
-        root = ET.Element("tv", attrib={"generator-info-name": "jgomez177", "generated-ts": ""})
-
-        for station in station_list:
-            channel = ET.SubElement(root, "channel", attrib={"id": station["id"]})
-            display_name = ET.SubElement(channel, "display-name")
-            display_name.text = self.strip_illegal_characters(station["name"])
-            ET.SubElement(channel, "icon", attrib={"src": station["logo"]})
 
         if isinstance(country_code, str):
             program_data = self.epg_data.get(country_code, [])
@@ -585,22 +693,43 @@ class Client:
             if isinstance(program_data, str):
                 return program_data
 
-        for elem in program_data:
-            root = self.read_epg_data(elem, root)
-
-        tree = ET.ElementTree(root)
-        ET.indent(tree, '  ')
-
-        doctype = '<!DOCTYPE tv SYSTEM "xmltv.dtd">'
-        xml_declaration = "<?xml version='1.0' encoding='utf-8'?>"
-        output_content = xml_declaration + '\n' + doctype + '\n' + ET.tostring(root, encoding='utf-8').decode('utf-8')
-
-        with open(xml_file_path, "w", encoding='utf-8') as f:
-            f.write(output_content)
+        # Serialize one element at a time so only a single <channel> or
+        # <programme> subtree is held in memory.  Both the plain and gzipped
+        # guides are served, so the one serialization is teed into both files.
+        # Build into temp files and swap them in only once the guide is
+        # complete, so a failed run leaves the previous guide being served.
+        tmp_xml_path = f"{xml_file_path}.tmp"
+        tmp_compressed_path = f"{compressed_file_path}.tmp"
+        try:
+            with open(tmp_xml_path, 'wb') as plain_file, \
+                    open(tmp_compressed_path, 'wb') as compressed_raw, \
+                    gzip.GzipFile(filename=os.path.basename(xml_file_path), mode='wb',
+                                  fileobj=compressed_raw, compresslevel=6) as compressed_file, \
+                    ET.xmlfile(TeeWriter(plain_file, compressed_file), encoding='utf-8') as xf:
+                xf.write_declaration()
+                xf.write_doctype(XMLTV_DOCTYPE)
+                with xf.element("tv", {"generator-info-name": "jgomez177", "generated-ts": ""}):
+                    xf.write("\n")
+                    for station in station_list:
+                        channel = ET.Element("channel", attrib={"id": self.strip_illegal_characters(station["id"])})
+                        display_name = ET.SubElement(channel, "display-name")
+                        display_name.text = self.strip_illegal_characters(station["name"])
+                        ET.SubElement(channel, "icon", attrib={"src": self.strip_illegal_characters(station["logo"])})
+                        xf.write(channel, "\n")
+
+                    for elem in program_data:
+                        for programme in self.read_epg_data(elem):
+                            xf.write(programme, "\n")
+        except Exception:
+            for path in (tmp_xml_path, tmp_compressed_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            raise
 
-        with open(xml_file_path, 'rb') as file:
-            with gzip.open(compressed_file_path, 'wb') as compressed_file:
-                compressed_file.writelines(file)
+        os.replace(tmp_xml_path, xml_file_path)
+        os.replace(tmp_compressed_path, compressed_file_path)
 
         self.epg_data = {}
         return None
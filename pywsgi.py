@@ -467,7 +467,7 @@ def watch(provider, country_code, id):
     if error: return error, 500
 
     # Get stitcherParams from the same slot's cached response
-    resp = slot_session.response_list.get(country_code, {})
+    resp = slot_session.cached_response(country_code) or {}
     stitcherParams = resp.get("stitcherParams", '')
 
     # Construct the authenticated URL for all streams